@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 """The Point representing an x, y coordinate in the environment plane.
 
-This is the x, y coordinate of an object in the simulation environment. A point can
-also be updated or changed.
+This is the x, y coordinate of an object in the simulation environment. The positions of
+active aircraft are stored in the environment's state arrays, a Point is only built from a row
+when it is asked for.
 """
 
-from math import cos, sin
-
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
 
@@ -30,12 +29,14 @@ class Point:
 
     Methods
     -------
-    update(h, d)
-        Move the current point by some distance in some heading
+    from_row(env, idx)
+        Returns the position of the aircraft in row idx of the environment's state arrays
     
     get
         Returns the coordinates of the point
     """
+    __slots__ = ('x', 'y')
+
     def __init__(self, x: float, y: float):
         """
         Parameters
@@ -49,21 +50,20 @@ class Point:
         self.x = x
         self.y = y
     
-    def update(self, h:float, d:float):
+    @classmethod
+    def from_row(cls, env, idx:int):
         """
-        Move the point in a given direction by some distance (m)
+        Returns the position of the aircraft in row idx of the environment's state arrays
 
         Parameters
         ----------
-        h: float
-            The heading that point should be moved to
+        env: Environment
+            The environment holding the state arrays
         
-        d: float
-            The distance the point should be moved
+        idx: int
+            The row of the aircraft
         """
-
-        self.x = self.x + d*cos(h)
-        self.y = self.y + d*sin(h)
+        return cls(float(env.get_value('xs', idx)), float(env.get_value('ys', idx)))
     
     def get(self) -> (float, float):
         """
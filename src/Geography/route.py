@@ -1,15 +1,17 @@
 #!/usr/bin/env python
-"""route.py defines the class for handling routes flown by an aircraft.
+"""route.py defines the classes for handling routes flown by an aircraft.
 """
 
 import string
-from queue import Queue
+from math import sqrt
 
+import numpy as np
 import src.assets.colours as c
 from pygame import draw as d
 from src.geography.point import Point
 from src.geography.waypoint import Waypoint
-from src.utility.util import dist_to_line, get_dist, get_heading
+from src.utility.fast import get_dist_f, seg_dist_sq_f
+from src.utility.util import get_heading
 
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
@@ -20,9 +22,66 @@ __email__ = "thompson_e@gwu.edu"
 __status__ = "Development"
 
 
+class RouteTemplate:
+    """
+    The fixed part of a route, built once per route and shared by every copy of it.
+
+    Attributes
+    ----------
+    _id: string
+        The unique ID of the route
+    
+    waypoints: (Point/Waypoint)
+        The waypoints in order on the route
+    
+    init_heading: int
+        The initial route heading
+    
+    segments: np.array
+        The segment flown towards each waypoint (x1, y1, dx, dy, 1/det), shape (len(waypoints), 5)
+    
+    draw_path: [(float, float)]
+        The coordinates of each waypoint, as drawn to the window
+    """
+    def __init__(self, _id: string, route):
+        """
+        Parameters
+        ----------
+        _id: string
+            The unique ID of the route
+        
+        route: [Point/Waypoint]
+            The waypoints in order on the route
+
+        Raises
+        ------
+        Exception
+            Route must have at least 2 points, a start and end
+        """
+
+        if len(route) < 2:
+            raise Exception("Route must have a start and end waypoint")
+
+        self._id = _id                                              # Unique ID of the route
+        self.waypoints = tuple(route)                               # The waypoints on the route
+        self.init_heading = get_heading(route[0], route[1])         # The initial heading for the route
+        self.draw_path = [point.get() for point in route]           # The drawn route, fixed as routes don't change
+
+        # Legs are flown from the start waypoint towards each following waypoint
+        self.segments = np.zeros((len(route), 5))
+        x1, y1 = float(route[0].x), float(route[0].y)
+
+        for i in range(1, len(route)):
+            dx, dy = float(route[i].x)-x1, float(route[i].y)-y1
+            det = dx*dx + dy*dy
+
+            self.segments[i] = (x1, y1, dx, dy, 1.0/det if det > 0 else 0.0)
+
+
 class Route:
     """
-    Defines a route of either corridors or waypoints.
+    Defines a route of either corridors or waypoints. The waypoints are held in a RouteTemplate
+    shared between copies, a route only holds how far along them an aircraft is.
 
     Attributes
     ----------
@@ -32,8 +91,14 @@ class Route:
     origional_route: [Point/Waypoint]
         The origional unformatted route
 
-    route: [Point/Waypoint]
-        A queue of each waypoint on the route
+    _template: RouteTemplate
+        The shared fixed part of the route
+
+    _wps: (Point/Waypoint)
+        Each waypoint on the route in order
+    
+    _idx: int
+        The index of the next waypoint in _wps
     
     start: Point/Waypoint
         The start point of the route, used for generating aircraft
@@ -46,14 +111,26 @@ class Route:
     
     init_heading: int
         The initial route heading
+    
+    segment: (float, float, float, float, float)
+        The segment from the previous to the next waypoint (x1, y1, dx, dy, 1/det)
+    
+    _next_xy: (float, float)
+        The coordinates of the next waypoint
 
     Methods
     -------
-    init_route(route)
+    init_route
         Initilise the route and prepare the next waypoints
     
+    _refresh_segment
+        Cache the segment between the previous and next waypoints
+
+    set_index(idx)
+        Move the route on to the waypoint at idx
+
     update(ac_pos, wpt_dist = 10, max_dist = 25, acc = 3)
-        Run an update and all checks on the aircraft position
+        Run an update and all checks on the aircraft position, for a route followed outside an environment
 
     get_in_bound(pos, max_dist = 25, acc = 3)
         Returns if the a point is too far from the path between the next waypoint and previous waypoint
@@ -68,7 +145,7 @@ class Route:
         Place holder for handling the draw function of the route
 
     """
-    def __init__(self, _id: string, route):
+    def __init__(self, _id: string, route, template: RouteTemplate = None):
         """
         Parameters
         ----------
@@ -77,6 +154,9 @@ class Route:
         
         route: [Point/Waypoint]
             The waypoints in order on the route
+        
+        template: RouteTemplate
+            An existing template for the route to share, built from route when not given
 
         Raises
         ------
@@ -84,38 +164,63 @@ class Route:
             Route must have at least 2 points, a start and end
         """
 
-        if len(route) < 2:
-            raise Exception("Route must have a start and end waypoint")
+        if template is None:
+            template = RouteTemplate(_id, route)
 
         self._id = _id                  # Unique ID of the route
         self.origional_route = route    # The unedited route
+        self._template = template       # The shared fixed part of the route
 
-        self.init_route(route)
+        self.init_route()
     
-    def init_route(self, route):
+    def init_route(self):
         """
         Initilise the route and prepare the next waypoints
+        """
+
+        self._wps = self._template.waypoints                            # The waypoints on the route
+        self._idx = 1                                                   # Index of the next waypoint
+
+        self.start = self._wps[0]                                       # The start point of the route
+        self.next_waypoint = self._wps[self._idx]                       # The next waypoint after start
+        self.previous_waypoint = self.start                             # The waypoint the aircraft is leaving
+
+        self.init_heading = self._template.init_heading                 # The initial heading for the route
+
+        self._refresh_segment()
+    
+    def _refresh_segment(self):
+        """
+        Cache the segment between the previous and next waypoints, called whenever either changes
+        """
+        self.segment = tuple(self._template.segments[self._idx].tolist())
+        self._next_xy = (float(self.next_waypoint.x), float(self.next_waypoint.y))
+    
+    def set_index(self, idx: int):
+        """
+        Move the route on to the waypoint at idx, used when the environment advances the waypoints
+        of its whole fleet at once
 
         Parameters
         ----------
-        route: [Point/Waypoint]
-            The waypoints in order on the route
+        idx: int
+            The index of the next waypoint
         """
+        if idx == self._idx:
+            return
 
-        self.route = Queue()
+        self._idx = idx
 
-        for point in route:
-            self.route.put(point)
-        
-        self.start = self.route.get()                                   # The start point of the route
-        self.next_waypoint = self.route.get()                           # The next waypoint after start
-        self.previous_waypoint = self.start                             # The waypoint the aircraft is leaving
-
-        self.init_heading = get_heading(self.start, self.next_waypoint) # The initial heading for the route
+        if idx < len(self._wps):
+            self.next_waypoint = self._wps[idx]
+            self._refresh_segment()
     
     def update(self, ac_pos: Point, wpt_dist:float = 10, max_dist:int = 25, acc:int = 3) -> int:
         """
-        Run an update and all checks on the aircraft position
+        Run an update and all checks on the aircraft position, for a route followed on its own. The
+        routes of an environment's aircraft are advanced by the environment for the whole fleet
+        (see Environment.advance_routes), which moves them on with set_index, so this should not
+        be called for those.
 
         Parameters
         ----------
@@ -132,14 +237,13 @@ class Route:
             The accuracy to be considered
         """
 
-        d_next = self.dist_to_next(ac_pos)
         in_bound = self.get_in_bound(ac_pos, max_dist, acc)
 
         # Has the aircraft reached it's goal
         if self.next_waypoint.has_reached(ac_pos):
-            if self.route.qsize() <= 0:
+            self.set_index(self._idx+1)
+            if self._idx >= len(self._wps):
                 return 1
-            self.next_waypoint = self.route.get()
         
         # 
         if not in_bound[0]:
@@ -160,20 +264,17 @@ class Route:
             The maximum deviation distance where -1 is infinate
 
         acc: int
-            The accuracy to be considered
+            The accuracy to be considered (unused, the distance is no longer rounded)
         """
 
         if max_dist == -1:
-            return True
+            return True, 0
         
-       
+        x1, y1, dx, dy, inv_det = self.segment
 
-        distance = round(dist_to_line(self.previous_waypoint, self.next_waypoint, pos), acc)
+        d2 = seg_dist_sq_f(x1, y1, dx, dy, inv_det, pos.x, pos.y)
 
-        if distance < max_dist:
-            return True, distance
-        
-        return False, distance
+        return d2 < max_dist*max_dist, sqrt(d2)
     
     def dist_to_next(self, pos: Point) -> float:
         """
@@ -185,13 +286,15 @@ class Route:
             The point to measure distance to next waypoint
         """
 
-        return round(get_dist(self.next_waypoint, pos),5)
+        x2, y2 = self._next_xy
+
+        return get_dist_f(x2, y2, pos.x, pos.y)
 
     def copy(self):
         """
-        Copy the route to a new class
+        Copy the route to a new class, sharing the route template
         """
-        return Route(self._id, self.origional_route)
+        return Route(self._id, self.origional_route, self._template)
     
     def draw(self, WINDOW):
         """
@@ -202,9 +305,4 @@ class Route:
         WINDOW
             The output window
         """
-        path = []
-
-        for point in self.origional_route:
-            path.append(point.get())
-
-        d.lines(WINDOW,c.WHITE,False,path, width = 1)
+        d.lines(WINDOW,c.WHITE,False,self._template.draw_path, width = 1)
@@ -5,14 +5,12 @@ A waypoint is an extension of a Point. It holds extra information.
 """
 
 import string
+from math import inf, sqrt
 
 import src.assets.colours as c
-from numpy import inf
 from pygame import draw as d
-from pygame import font
+from src.assets.fonts import get_font
 from src.geography.point import Point
-from src.utility.util import in_bound
-from src.utility.util import dist_to_line
 
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
@@ -33,6 +31,15 @@ class Waypoint(Point):
     
     bounds: the bounds 
     
+    x_min, x_max, y_min, y_max: float
+        The extent of the bounds on each axis
+    
+    reach_r2: float
+        The squared radius of the circle enclosing the bounds
+    
+    _edges: ((float,float,float,float,float))
+        Each edge of the bounds as its first corner, the vector to the next corner and its squared length
+    
     Methods
     -------
     draw(WINDOW)
@@ -67,9 +74,21 @@ class Waypoint(Point):
         super().__init__(x, y)  # Initilise parent
 
         self._id = _id              # The unique ID for the waypoint
+        self._label = None          # The rendered ID, created on the first draw
 
         # tl, bl, tr, br
         self.bounds = [(self.x-x_pad,self.y-y_pad), (self.x+x_pad,self.y-y_pad), (self.x+x_pad,self.y+y_pad), (self.x-x_pad,self.y+y_pad)]
+        self.x_min, self.x_max = self.x-x_pad, self.x+x_pad
+        self.y_min, self.y_max = self.y-y_pad, self.y+y_pad
+
+        # Nothing further than this (squared) from the waypoint can be within the bounds
+        self.reach_r2 = x_pad*x_pad + y_pad*y_pad
+
+        # The bounds edges, precomputed as they never change
+        self._edges = tuple(
+            (bx, by, ex-bx, ey-by, (ex-bx)**2 + (ey-by)**2)
+            for (bx, by), (ex, ey) in zip(self.bounds, self.bounds[1:]+self.bounds[:1])
+        )
     
     def draw(self, WINDOW):
         """
@@ -81,21 +100,25 @@ class Waypoint(Point):
             The output window
         """
 
-        f = font.SysFont('couriernew', 15)
+        # The ID never changes so is only rendered once, on the first draw
+        if self._label is None:
+            self._label = get_font().render(f'{self._id}', True, c.WHITE)
+
         d.polygon(WINDOW, c.WHITE, [(self.x-2,self.y-2), (self.x+2,self.y-2), (self.x+2,self.y+2), (self.x-2,self.y+2)])
         d.polygon(WINDOW, c.WHITE, self.bounds, width = 1)
-        WINDOW.blit(f.render(f'{self._id}', True, c.WHITE), (self.x+35, self.y-55))
+        WINDOW.blit(self._label, (self.x+35, self.y-55))
     
     def has_reached(self, apos: Point) -> bool:
         """
-        Returns if the aircraft has reached the waypoint bounds
+        Returns if the aircraft has reached the waypoint bounds, the bounds are axis aligned so
+        this is a box test (the boundary itself is outside, as with in_bound)
 
         Parameters
         ----------
         apos: Point
             The aircraft position
         """
-        return in_bound(self.bounds, apos)
+        return (self.x_min < apos.x < self.x_max) and (self.y_min < apos.y < self.y_max)
     
     def dist_from(self, apos: Point) -> float:
         """
@@ -107,9 +130,15 @@ class Waypoint(Point):
             The aircraft position
         """
 
-        min_dist = 9e10
+        px, py = apos.x, apos.y
+        best = inf
 
-        for i in range(-1, len(self.bounds)-1):
-            min_dist = min(dist_to_line(Point(self.bounds[i][0],self.bounds[i][1]), Point(self.bounds[i+1][0],self.bounds[i+1][1]), apos),min_dist)
-        
-        return round(min_dist,3)
+        # Closest point on each edge, clamped to the ends of the edge. Only four edges so this is
+        # quicker as scalar math than as numpy arrays
+        for bx, by, ex, ey, elen2 in self._edges:
+            t = min(max(((px-bx)*ex + (py-by)*ey)/elen2, 0), 1)
+            dx = px - (bx + t*ex)
+            dy = py - (by + t*ey)
+            best = min(best, dx*dx + dy*dy)
+
+        return sqrt(best)
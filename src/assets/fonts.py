@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""The fonts shared by everything drawn to the window.
+
+The font is loaded the first time it is asked for rather than on import, as pygame has to be
+initilised (by the UI) before a font can be created.
+"""
+
+from pygame import font
+
+__author__ = "Ellis Thompson"
+__credits__ = ["Ellis Thompson"]
+
+__license__ = "GNU GPLv3"
+__maintainer__ = "Ellis Thompson"
+__email__ = "thompson_e@gwu.edu"
+__status__ = "Development"
+
+_FONT = None    # The shared text font, loaded on first use
+
+def get_font() -> font.Font:
+    """
+    Returns the shared text font, loading it the first time it is needed
+    """
+    global _FONT
+
+    if _FONT is None:
+        _FONT = font.SysFont('couriernew', 15)
+
+    return _FONT
@@ -2,16 +2,20 @@
 """Provides the Aircraft class for the simulation, the aircraft is a simple simulated entity.
 
 Aircraft is respoinsible for the simplified implementation of an aircraft.
+
+Constants
+---------
+MAX_PATH
+    The maximum number of points kept of an aircraft's path
 """
 
 import string
-from collections import OrderedDict
-from math import pi, radians
 
 import numpy as np
 import src.assets.colours as c
+from pygame import SRCALPHA, Surface
 from pygame import draw as d
-from pygame import font
+from src.assets.fonts import get_font
 from src.geography import point, route
 
 __author__ = "Ellis Thompson"
@@ -23,16 +27,25 @@ __email__ = "thompson_e@gwu.edu"
 __status__ = "Development"
 
 
+MAX_PATH = 512
+
 class Aircraft:
     """
-    Defines an aircraft and its calculations to take each step
+    Defines an aircraft and its calculations to take each step. The numeric state of an active
+    aircraft lives in the environment's state arrays, the aircraft is a view onto its row.
 
     Attributes
     ----------
     _id: string
         The given ID of the aircraft
     
-    pos: point
+    env: Environment
+        The environment holding the aircraft's state arrays
+    
+    idx: int
+        The row of the aircraft in the environment's state arrays (None once detached)
+    
+    position: point
         The position of the aircraft
     
     spd: float
@@ -53,11 +66,14 @@ class Aircraft:
     route: Route
         The route of the aircraft
     
-    path: [Points]
-        The path the aircraft has followed
+    path: np.array
+        Ring buffer of the most recent points of the path the aircraft has followed, shape (MAX_PATH, 2)
     
-    updater: int
-        The number of times the aircraft has been updated
+    path_n: int
+        The number of points held in the path
+    
+    path_head: int
+        The index the next path point is written to
     
     point_constant: int
         A constant for the frequency for adding points to the path
@@ -73,24 +89,30 @@ class Aircraft:
     
     text_boost: int
         Where the aircraft info text should start    
+    
+    _sprites: {(int,int,(int,int,int)): Surface}
+        The rendered aircraft symbols, shared by every aircraft with the same size, boarder size and colour
 
     Methods
     -------
-    step(bounds)
-        Simulates an aircraft step
-    
-    update_position
-        Update the aircraft's position using speed, heading and current position
+    add_path_point
+        Add the current position to the path
     
-    in_world(bounds)
-        Test that the aircraft is in the world, return if it exists in the world
+    detach
+        Copy the aircraft's state out of the environment arrays once it is no longer active
     
     draw(WINDOW)
         Draws the aircraft to the window
     
+    get_sprite(colour)
+        Get the rendered aircraft symbol
+    
     draw_path
         Draw the path of the aircraft to the window
     
+    get_path
+        Get the points of the path in the order they were flown
+    
     get_text_stats
         Get the text to output and its starting position
     
@@ -98,7 +120,12 @@ class Aircraft:
         Get the current state of the aircraft
 
     """
-    def __init__(self, _id:string, start_pos:point.Point, spd:float = 30, alt:float = 100, heading:float = 0, scale:float = 1, route:route.Route = None):
+    __slots__ = ('_id', 'env', 'idx', '_final', 'tas', 'scale', 'route', 'path', 'path_n', 'path_head', '_path_pts', 'point_constant',
+        'size', 'boarder_size', 'text_boost', '_static_text', '_hdg_surf', '_text')
+
+    _sprites = {}
+
+    def __init__(self, _id:string, env, start_pos:point.Point, spd:float = 30, alt:float = 100, heading:float = 0, scale:float = 1, route:route.Route = None):
         """
         Parameters
         ----------
@@ -106,6 +133,9 @@ class Aircraft:
         _id: string
             The given ID of the aircraft
         
+        env: Environment
+            The environment to store the aircraft state in
+        
         start_pos: point
             The starting position of the aircraft
         
@@ -125,80 +155,121 @@ class Aircraft:
             The route of the aircraft
         """
         self._id = _id                      # The aircraft ID
-        self.position = point.Point(start_pos.x, start_pos.y)           # The current aircraft position
-        self.spd = (min(45,spd)/scale)/60 # The current aircraft speed (m/s)
+        self.env = env                      # The environment holding the aircraft state
+        self._final = None                  # The state of the aircraft once detached from the environment
+
+        # The current position, speed (m/s), heading (deg) and altitude (m) of the aircraft
+        self.idx = env.add_state(self, start_pos.x, start_pos.y, (min(45,spd)/scale)/60, (heading*-1)%360, alt)
+
         self.tas = spd                      # The visual true airspeed of the aircraft
-        self.alt = alt                      # The current altitude (m)
-        self.heading = (heading*-1)%360     # The current heading (deg)
         self.scale = scale                  # The world scale
         self.route = route                  # The route the aircraft is on
-        self.path = []                      # Points of the traversed path of the aircraft
-        self.updater = 0                    # How many times the aircraft has been updated
+        self.path = np.empty((MAX_PATH,2), dtype=np.float32)   # Points of the traversed path of the aircraft
+        self.path_n = 0                     # Number of points in the path
+        self.path_head = 0                  # Where the next path point is written
+        self._path_pts = None               # The path points in drawing order, cleared when a point is added
         self.point_constant = 18            # A constant value for adding points
-        self.terminated = 0                 # How has the aircraft been terminated (0: exists, 1: safe, 2: out of bounds, 3: collision)
 
         # Visual constants
         self.size = max(2, int(3/self.scale))           # Size of the visual aircraft
         self.boarder_size = max(6, int(25/self.scale))  # Size for the visual boarder of the aircraft
         self.text_boost = max(16, int(35/self.scale))   # Where the text should start
+        self._static_text = None                        # The rendered ID, speed and altitude, created on the first draw
+        self._hdg_surf = None                           # The rendered heading, cleared by Environment.set_heading
+        self._text = None                               # The rendered text lines
     
 
-    def step(self, bounds: (int,int)):
+    @property
+    def position(self) -> point.Point:
         """
-        Simulates an aircraft step
-
-        Parameters
-        ----------
-        bounds: (int,int)
-            The bound of the world in meters (without scaling applied)
-
+        The current position of the aircraft
         """
-
-        # Update the aircrafts position
-        self.update_position()
-
-        # Update the path drawing for the aircraft
-        if (self.updater%self.point_constant)*self.scale == 0:
-            self.path.append(self.position.get())
-
-        self.terminated = 0
-
-        if not self.route == None:
-            self.terminated = self.route.update(self.position)
-
-        if self.terminated == 0: 
-            if not self.in_world(bounds):
-                self.terminated = 2
-
-        # print(f'{self._id}, {self.route.next_waypoint.dist_from(self.position)}')
-
-        self.updater += 1
-
-    
-    def update_position(self):
+        # The UI thread reads this while the environment can detach the aircraft, so idx is read once
+        idx = self.idx
+        if idx is None:
+            return point.Point(self._final['x'], self._final['y'])
+        return point.Point.from_row(self.env, idx)
+
+    @property
+    def spd(self) -> float:
         """
-        Update the aircraft's position using speed, heading and current position
+        The current speed of the aircraft
         """
-        hdg = (self.heading-180)%360    # Convert heading into sim heading
+        idx = self.idx
+        if idx is None:
+            return self._final['spd']
+        return float(self.env.get_value('spd', idx))
 
-        hdg = pi/2 - radians(hdg)
-        sim_speed = self.spd/self.scale # Change the speed to the simulated speed
+    @property
+    def heading(self) -> float:
+        """
+        The current heading of the aircraft
+        """
+        idx = self.idx
+        if idx is None:
+            return self._final['hdg']
+        return float(self.env.get_value('hdg', idx))
+
+    @heading.setter
+    def heading(self, value: float):
+        # Raises a ValueError once the aircraft is terminated (see Environment.set_heading)
+        self.env.set_heading(self.idx, value)
+
+    @property
+    def alt(self) -> float:
+        """
+        The current altitude of the aircraft
+        """
+        idx = self.idx
+        if idx is None:
+            return self._final['alt']
+        return float(self.env.get_value('alts', idx))
 
-        self.position.update(hdg, sim_speed)
-    
-    def in_world(self, bounds: (int,int)) -> bool:
+    @property
+    def terminated(self) -> int:
+        """
+        How has the aircraft been terminated (0: exists, 1: safe, 2: out of bounds, 3: collision)
         """
-        Test that the aircraft is in the world, return if it exists in the world
+        idx = self.idx
+        if idx is None:
+            return self._final['term']
+        return int(self.env.get_value('term', idx))
+
+    @terminated.setter
+    def terminated(self, value: int):
+        # A detached aircraft has no row, indexing the arrays with None would write every row
+        if self.idx is None:
+            self._final['term'] = value
+        else:
+            self.env.term[self.idx] = value
+
+    def detach(self):
+        """
+        Copy the aircraft's state out of the environment arrays once it is no longer active
+        """
+        if self.idx is None:
+            return
+
+        self._final = {
+            'x': float(self.env.xs[self.idx]),
+            'y': float(self.env.ys[self.idx]),
+            'spd': float(self.env.spd[self.idx]),
+            'hdg': float(self.env.hdg[self.idx]),
+            'alt': float(self.env.alts[self.idx]),
+            'term': int(self.env.term[self.idx])
+        }
+        self.idx = None
 
-        Parameters
-        ----------
-        bounds: (int,int)
-            The bound of the world in meters (without scaling applied)
+    def add_path_point(self):
+        """
+        Add the current position to the path. The aircraft is stepped by the environment for the
+        whole fleet at once, which calls this every point_constant steps.
         """
-        if 0 <= self.position.x <= bounds[0]:
-            if 0 <= self.position.y <= bounds[1]:
-                return True
-        return False
+        self.path[self.path_head] = (self.env.xs[self.idx], self.env.ys[self.idx])
+        self.path_head = (self.path_head+1)%MAX_PATH
+        self.path_n = min(self.path_n+1, MAX_PATH)
+        self._path_pts = None
+
     
     def draw(self, WINDOW):
         """
@@ -213,8 +284,9 @@ class Aircraft:
         self.draw_path(WINDOW)
 
         # Draw the aircraft object
-        d.circle(WINDOW, c.SAFE, self.position.get(), self.size)
-        d.circle(WINDOW, c.SAFE, self.position.get(), self.boarder_size,1)
+        pos = self.position
+        r = self.boarder_size
+        WINDOW.blit(self.get_sprite(c.SAFE), (pos.x-r, pos.y-r))
 
         # Draw its related stats
         text_arr, t_pos = self.get_text_stats()
@@ -225,6 +297,28 @@ class Aircraft:
             WINDOW.blit(t, (x, y))
 
 
+    def get_sprite(self, colour: (int,int,int)) -> Surface:
+        """
+        Get the aircraft symbol (a dot in a ring) centred on (boarder_size, boarder_size), it is
+        only rendered the first time it is needed for each size and colour
+
+        Parameters
+        ----------
+        colour: (int,int,int)
+            The colour of the symbol
+        """
+        key = (self.size, self.boarder_size, colour)
+        sprite = Aircraft._sprites.get(key)
+
+        if sprite is None:
+            r = self.boarder_size
+            sprite = Surface((2*r+1, 2*r+1), SRCALPHA)
+            d.circle(sprite, colour, (r, r), self.size)
+            d.circle(sprite, colour, (r, r), r, 1)
+            Aircraft._sprites[key] = sprite
+
+        return sprite
+
     def draw_path(self, WINDOW):
         """
         Draw the path of the aircraft to the window
@@ -234,31 +328,45 @@ class Aircraft:
         WINDOW
             The window to output to
         """
-        if len(self.path) > 1:
-            d.lines(WINDOW,c.LINE,False,self.path, width = 1)
+        if self.path_n > 1:
+            # Points are only added every few steps (and never once terminated) so the list pygame
+            # needs is kept between draws
+            if self._path_pts is None:
+                self._path_pts = self.get_path().tolist()
+
+            d.lines(WINDOW,c.LINE,False,self._path_pts, width = 1)
+    
+    def get_path(self) -> np.array:
+        """
+        Get the points of the path in the order they were flown
+        """
+        if self.path_n < MAX_PATH:
+            return self.path[:self.path_n]
+
+        # The buffer has wrapped, the oldest point is at the head
+        return np.concatenate((self.path[self.path_head:], self.path[:self.path_head]))
 
     
     def get_text_stats(self)-> (string, (float,float)):
         """
         Get the text to output and its starting position
         """
-        f = font.SysFont('couriernew', 15)
-        text = []
-
-        # Add ID
-        t = f'{self._id}'
-        text.append(f.render(t, True, c.WHITE))
-        # Add heading
-        t = f'{int((self.heading*-1)%360)}'
-        text.append(f.render(t, True, c.WHITE))
-        # Add Speed
-        t = f'{self.tas}m/s'
-        text.append(f.render(t, True, c.WHITE))
-        # Add Altitude
-        t = f'{self.alt}m'
-        text.append(f.render(t, True, c.WHITE))
-
-        return text,(self.position.x + self.text_boost,self.position.y-self.text_boost)
+        # The ID, speed and altitude never change so are rendered once, on the first draw
+        if self._static_text is None:
+            f = get_font()
+            self._static_text = (
+                f.render(f'{self._id}', True, c.WHITE),
+                f.render(f'{self.tas}m/s', True, c.WHITE),
+                f.render(f'{self.alt:g}m', True, c.WHITE)
+            )
+
+        # The heading is only rendered again once it has been changed
+        if self._hdg_surf is None:
+            self._hdg_surf = get_font().render(f'{int((self.heading*-1)%360)}', True, c.WHITE)
+            self._text = [self._static_text[0], self._hdg_surf, self._static_text[1], self._static_text[2]]
+
+        pos = self.position
+        return self._text,(pos.x + self.text_boost,pos.y-self.text_boost)
     
     def get_state(self) -> dict:
         """
@@ -269,7 +377,7 @@ class Aircraft:
             'pos':self.position,
             'hdg': self.heading,
             'spd': self.spd,
-            'next_wpt': self.route.next_waypoint
+            'next_wpt': None if self.route is None else self.route.next_waypoint
         }
 
         return state
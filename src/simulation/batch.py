@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Runs whole simulation trials in parallel, one trial per worker process.
+
+Each step of a simulation depends on the last, but separate trials (different seeds or
+parameters) are independent of each other. run_batch farms each trial out to a process pool,
+every worker building and running its own Environment without the UI.
+
+A trial is described by a config dictionary, the key max_aircraft is used by the trial and
+every other key is passed on to the Environment, e.g.
+
+    {'area': (800,800), 'env_path': 'files/cohesive_env/env1.json', 'seed': 0, 'max_aircraft': 50}
+
+As the pool starts new processes, run_batch should be called from under
+if __name__ == '__main__'.
+"""
+
+from multiprocessing import Pool
+
+from src.simulation.environment import Environment
+
+__author__ = "Ellis Thompson"
+__credits__ = ["Ellis Thompson"]
+
+__license__ = "GNU GPLv3"
+__maintainer__ = "Ellis Thompson"
+__email__ = "thompson_e@gwu.edu"
+__status__ = "Development"
+
+
+def run_batch(configs: [dict], processes: int = None, maxtasksperchild: int = 10) -> [dict]:
+    """
+    Run a batch of simulation trials in parallel, returning the result of each trial in the
+    order of configs
+
+    Parameters
+    ----------
+    configs: [dict]
+        The config of each trial
+
+    processes: int
+        The number of worker processes (None for one per CPU)
+
+    maxtasksperchild: int
+        The number of trials a worker runs before it is replaced, to release its memory
+    """
+    with Pool(processes=processes, maxtasksperchild=maxtasksperchild) as pool:
+        return pool.map(_run_one, configs)
+
+def _run_one(config: dict) -> dict:
+    """
+    Run a single trial until max_aircraft have been generated, returning every aircraft of the trial as
+    {_id: {'terminated': int, 'path': [(float,float)]}}, those still flying when it ends with terminated 0
+
+    Parameters
+    ----------
+    config: dict
+        The config of the trial
+    """
+    config = dict(config)
+    max_aircraft = config.pop('max_aircraft', 0)
+
+    if max_aircraft <= 0:
+        raise ValueError('A batch trial needs max_aircraft > 0 or it never finishes')
+
+    config['visual'] = False
+
+    env = Environment(**config)
+    env.run(max_aircraft=max_aircraft)
+
+    # Only plain data is sent back, the aircraft hold a reference to the whole environment. The run
+    # stops once the last aircraft is generated, so some are still active
+    return {
+        _id: {'terminated': ac.terminated, 'path': ac.get_path().tolist()}
+        for acs in (env.terminated, env.aircraft) for _id, ac in acs.items()
+    }
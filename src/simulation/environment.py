@@ -4,17 +4,25 @@
 Environment is responsible for running the simulation at each step as well as checking
 for terminal conditions and generation new aircraft. It usually runs disjointed from the
 UI but when the UI is active is bound by the FPS of that UI.
+
+Constants
+---------
+HALF_PI
+    pi/2, the offset between aircraft and simulator headings
 """
 
 import string
-from collections import OrderedDict
-from time import sleep
+import sys
+from collections import defaultdict, deque
+from itertools import islice
+from math import cos, pi, radians, sin
+from time import perf_counter, sleep
 
 import numpy as np
 from src.geography.point import Point
 from src.simulation.aircraft import Aircraft
+from src.utility.fast import HAS_NUMBA, close_pairs_f, pairwise_dist_f, tick_f
 from src.utility.filehandling import load_json
-from src.utility.util import get_dist
 
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
@@ -25,6 +33,20 @@ __email__ = "thompson_e@gwu.edu"
 __status__ = "Development"
 
 
+HALF_PI = pi/2
+
+def sim_heading(hdg: float) -> float:
+    """
+    Convert an aircraft heading (deg) into the simulator heading (rad) used to move it
+
+    Parameters
+    ----------
+    hdg: float
+        The aircraft heading
+    """
+    return HALF_PI - radians((hdg-180)%360)
+
+
 class Environment():
     """
     Enrironment, where all methods for updating positions and the current environment state go.
@@ -61,8 +83,26 @@ class Environment():
     ac_prefix: string
             The prefix to assign to aircraft
     
+    routes: {string: Route}
+        The routes aircraft are generated on
+    
+    terminated: {string: Aircraft}
+        The aircraft that have been terminated
+    
+    aircraft: {string: Aircraft}
+        The active aircraft
+    
+    waypoints: {string: Waypoint}
+        The waypoints of the routes
+    
+    max_paths: int
+        The most old paths that can be drawn
+    
+    max_terminated: int
+        The most terminated aircraft kept (0 to keep them all)
+    
     objects: dict
-        A dictionary containing all elements in the simulaton or that have existed
+        A dictionary containing all elements in the simulaton or that have existed (read only)
     
     old_paths: [[(int,int)]]
         An array of old paths
@@ -72,6 +112,57 @@ class Environment():
     
     ran: bool
         Has the simulation run yet
+
+    xs: np.array
+        The x coordinate of each active aircraft
+    
+    ys: np.array
+        The y coordinate of each active aircraft
+    
+    hdg: np.array
+        The heading of each active aircraft
+    
+    spd: np.array
+        The speed of each active aircraft
+    
+    alts: np.array
+        The altitude of each active aircraft
+    
+    term: np.array
+        How each active aircraft has been terminated (see Aircraft.terminated)
+    
+    seg: np.array
+        The route segment each active aircraft is flying (x1, y1, dx, dy, 1/det), shape (N, 5)
+    
+    max_dist: float
+        The maximum distance an aircraft can deviate from its route
+    
+    min_sep: float
+        The minimum separation between aircraft, any closer have collided
+    
+    use_numba: bool
+        If the fleet is stepped with the compiled kernel
+    
+    next_wp_xy: np.array
+        The coordinates of each active aircraft's next waypoint, shape (N, 2)
+    
+    next_wp_r2: np.array
+        The squared reach radius of each active aircraft's next waypoint
+    
+    route_id: np.array
+        The index of each active aircraft's route in the route table (-1 for none)
+    
+    wp_idx: np.array
+        The index of each active aircraft's next waypoint along its route
+    
+    until_sample: np.array
+        The number of steps until each active aircraft next adds a point to its path
+    
+    _rows: [Aircraft]
+        The aircraft in each row of the state arrays
+    
+    _wp_grid: {(int,int): [Waypoint]}
+        A uniform grid of the route waypoints keyed by cell, for nearby waypoint queries
     
     Methods
     -------
@@ -81,15 +172,64 @@ class Environment():
     step
         A single step of the simulation
     
+    advance(dt = 1)
+        Advance the position of every active aircraft in one vectorised update
+    
+    add_state(ac, x, y, spd, hdg, alt)
+        Add a new row to the aircraft state arrays, returning its index
+    
+    reserve(cap)
+        Grow the state buffers to hold at least cap rows
+    
+    advance_fleet
+        Advance every aircraft, returning which are near their next waypoint and which are on their route
+    
+    get_value(name, idx)
+        Returns the value of a state column in row idx, safe to call from the UI thread
+    
+    set_heading(idx, hdg)
+        Change the heading of the aircraft in row idx
+    
+    velocity(spd, hdg)
+        Returns the distance moved in x and y each step at a speed and heading
+    
+    set_route(idx, k)
+        Put the aircraft in row idx on the route k, at the start of the route
+    
+    advance_routes(near, on_route)
+        Move every aircraft that has reached its next waypoint on along its route and terminate any
+        that have finished or left their routes
+    
+    get_near_next_wp
+        Returns which aircraft are close enough to have reached their next waypoint
+    
+    get_on_route
+        Returns which aircraft are within max_dist of their route
+    
     update_active
         Update the list of active aircraft, moving terminated aircraft to the terminated list.
     
     generate_ac(k)
         Generate an aircraft at the point correspoiding to position k
+    
+    get_ac_id(n)
+        Returns the ID of the nth generated aircraft
+    
+    next_delay
+        Returns a random delay before the next aircraft generation on a route
+    
+    next_spawn_stats
+        Returns a random speed and altitude for a generated aircraft
+    
+    draw_start_routes
+        Returns the routes that generate an aircraft as soon as the simulation is run
 
-    check_collisions(dist_matrix, min_sep = 25)
+    check_collisions(close)
         Check the aircraft in the environment for any collisions and terminate where applicible 
     
+    get_close_pairs
+        Returns the rows of each pair of aircraft closer than min_sep
+    
     get_is_finished
         Returns if the simulation is active
     
@@ -101,9 +241,44 @@ class Environment():
     
     get_distance_matrix:
         Generate a distance matrix of aircraft active in the environment
+    
+    build_route_table
+        Flatten the waypoints and legs of every route into the route table arrays
+    
+    build_wp_grid
+        Bucket the waypoints of every route into the waypoint grid
+    
+    get_near_waypoints(pos)
+        Returns the waypoints in the cells around a position
+    
+    get_nearest_waypoint(pos)
+        Returns the waypoint whose bounds are closest to a position (None if none are close)
 
     """
-    def __init__(self, area:(int,int), visual:bool = True, fps:int =60, scale:float = 1, time_scale:float = 1, min_spd: int = 15, max_spd: int = 40, min_alt: int = 100, max_alt: int = 100, ac_prefix:string = "AC", delay:[int] = [5,7,11], env_path:string = None):
+
+    _wp_cell = 100  # The cell size of the waypoint grid (m)
+
+    # The aircraft state arrays, one row per active aircraft: name -> (dtype, shape of a row). The
+    # positions, speeds and altitudes are simple physical values so are held as float32, halving
+    # the memory each step passes over
+    _columns = dict([
+        ('xs', (np.float32, ())),           # x coordinates
+        ('ys', (np.float32, ())),           # y coordinates
+        ('hdg', (np.float64, ())),          # Headings (deg)
+        ('spd', (np.float32, ())),          # Speeds
+        ('alts', (np.float32, ())),         # Altitudes (m)
+        ('_vx', (np.float32, ())),          # Distance moved in x each step, updated only when a heading changes
+        ('_vy', (np.float32, ())),          # Distance moved in y each step, updated only when a heading changes
+        ('next_wp_xy', (np.float64, (2,))), # Next waypoint coordinates
+        ('next_wp_r2', (np.float64, ())),   # Next waypoint squared reach radius
+        ('seg', (np.float64, (5,))),       # Route segment being flown
+        ('route_id', (np.int32, ())),       # Route in the route table
+        ('wp_idx', (np.int32, ())),         # Index of the next waypoint along the route
+        ('until_sample', (np.int32, ())),   # Steps until the next path point
+        ('term', (np.int8, ()))             # Termination state
+    ])
+
+    def __init__(self, area:(int,int), visual:bool = True, fps:int =60, scale:float = 1, time_scale:float = 1, min_spd: int = 15, max_spd: int = 40, min_alt: int = 100, max_alt: int = 100, ac_prefix:string = "AC", delay:[int] = [5,7,11], env_path:string = None, use_numba:bool = True, seed:int = None, max_terminated:int = 0):
         """
         Parameters
         ----------
@@ -145,6 +320,15 @@ class Environment():
         
         env_path: string
             The file path to load an environment
+        
+        use_numba: bool
+            If the fleet is stepped with the compiled kernel (only when numba is installed)
+        
+        seed: int
+            The seed for the random generation of aircraft (None for a random seed)
+        
+        max_terminated: int
+            The most terminated aircraft to keep, the oldest are dropped past it (0 to keep them all)
 
         """
         # Environment Parameters
@@ -152,6 +336,7 @@ class Environment():
         self.visual = visual                    # Is the UI present
         self.fps = fps                          # What fps does the simulation run at
         self.scale = scale                      # The world scale multiplier
+        self._inv_scale = 1.0/scale             # The inverse of the world scale, the scale never changes
         self.time_scale = time_scale            # How quickly should the simulation run
 
         # Aircraft Parameters (for generation)
@@ -161,24 +346,62 @@ class Environment():
         self.min_alt = min_alt                  # Minimum aircraft altitude
         self.max_alt = max_alt                  # Maximum aircraft Altitude
         self.ac_prefix = ac_prefix              # Default string prefix
+        self._id_pool = []                      # Interned aircraft IDs, grown in blocks as needed
+        self._rng = np.random.default_rng(seed) # Random generator for aircraft generation
+        self._delays = []                       # Drawn generation delays, used in order
+        self._delay_i = 0                       # The next drawn delay to use
+        self._stats = []                        # Drawn (speed, altitude) of generated aircraft, used in order
+        self._stats_i = 0                       # The next drawn speed and altitude to use
+        self.max_dist = 25                      # Maximum deviation from a route
+        self.min_sep = 25                       # Minimum separation between aircraft (m)
+        self._no_pairs = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))  # Empty result of get_close_pairs
+        self.use_numba = use_numba and HAS_NUMBA  # Step the fleet with the compiled kernel
 
         # Objects
-        self.objects = {  
-            'routes':OrderedDict(),
-            'terminated':OrderedDict(),
-            'aircraft':OrderedDict(),    
-            'waypoints':OrderedDict()                  # Dictionary of objects
-        }
+        self.routes = {}                        # The routes aircraft are generated on
+        self.terminated = {}                    # The aircraft that have been terminated
+        self.aircraft = {}                      # The active aircraft
+        self.waypoints = {}                     # The waypoints of the routes
+        self.max_paths = 100                    # The most old paths that can be drawn
+        self._recent = deque(maxlen=self.max_paths)  # The most recently terminated aircraft, for drawing
+        self.max_terminated = max_terminated    # The most terminated aircraft kept (0 for all)
 
         if not env_path is None:
-            wpts, rts = load_json(env_path)
+            self.waypoints, self.routes = load_json(env_path)
 
-            self.objects['waypoints'] = wpts
-            self.objects['routes'] = rts
+        self.build_route_table()
+        self.build_wp_grid()
+
+        # Aircraft state, one contiguous array per column (Structure of Arrays). The columns are
+        # views of the first _n rows of buffers that double in size when full
+        self._n = 0                             # Number of active rows
+        self._cap = 0                           # Number of rows the buffers can hold
+        self._buf = {}                          # The backing buffer of each column
+        self._rows = []                         # The aircraft in each active row
+        self._n_routed = 0                      # Number of active rows following a route
+        self.reserve(16)
 
         # Simulation Parameters
         self.running = False                    # Is the simulation running
         self.ran = False                        # Has the simulation been run yet
+        self._finished = False                  # Has a run of the simulation ended
+        self._generated = 0                     # Number of aircraft generated by run
+        self._max_aircraft = 0                  # The number of aircraft run generates before stopping (0 for infinate)
+        self._next_ac = None                    # The time of the next generation on each route (s)
+        self._frame_dt = 0                      # The time of a frame in visual runs (s)
+        self._deadline = 0                      # When the current frame of a visual run should end
+
+    @property
+    def objects(self) -> dict:
+        """
+        All elements in the simulation or that have existed, by type
+        """
+        return {
+            'routes': self.routes,
+            'terminated': self.terminated,
+            'aircraft': self.aircraft,
+            'waypoints': self.waypoints
+        }
 
     def run(self, max_aircraft:int = 0):
         """
@@ -189,71 +412,500 @@ class Environment():
         max_aircraft: int
             The maximum number of aircraft to generate before the simulation terminates (0 for infinate)
         """
-        aircraft = 0
         step = 0
         timer = 0
-        next_ac = np.random.choice(self.delay, len(self.objects['routes'].keys()))
-        _len = size = np.random.randint(1, len(self.objects['routes'].keys())+1)
-        next_ac[np.random.randint(len(self.objects['routes'].keys()),
-        size = _len)] = 0
+        self._generated = 0
+        self._max_aircraft = max_aircraft
+
+        # Each route starts after a random delay, except those drawn to start straight away
+        self._next_ac = self._rng.choice(self.delay, len(self.routes)).astype(int)
+        self._next_ac[self.draw_start_routes()] = 0
+
+        self._frame_dt = (1/self.fps)/self.time_scale
+        self._deadline = perf_counter()
+
+        # Pick the generation and step methods for this configuration once, rather than testing
+        # for it every step
+        spawn = self._spawn_one if len(self.routes) == 1 else self._spawn_all
+        tick = self._tick_visual if self.visual else self.step
 
         self.ran = True
         self.running = True
+        self._finished = False
 
         while self.running:
-            if max_aircraft > 0 and aircraft == max_aircraft:
+            if max_aircraft > 0 and self._generated >= max_aircraft:
                 self.running = False
                 continue
             
-            # Generate the next AC if the timer is equal to the time of next aircraft generation
-            for i, t in enumerate(next_ac):
-                if timer == t:
-                    self.generate_ac(i, f'{self.ac_prefix}{aircraft}')
-                    next_ac[i] += np.random.choice(self.delay,1)[0]
-                    aircraft += 1
-
-            # Force a delay for UI operation so it doesn't run too quick
-            if self.visual:
-                sleep((1/self.fps)/self.time_scale)
-            
-            self.step()
+            # Generate the next AC if the timer is equal to the time of next aircraft generation, the
+            # timer only changes once every fps steps so it is only checked then
+            if step == 0:
+                spawn(timer)
+
+            tick()
             step = (step + 1) % self.fps
 
             if step == 0:
                 timer += 1
 
+        self._finished = True
+
+    def _spawn_all(self, timer:int):
+        """
+        Generate an aircraft on every route whose next generation time is the timer
+
+        Parameters
+        ----------
+        timer: int
+            The current time (s)
+        """
+        for i in np.flatnonzero(self._next_ac == timer):
+            # Several routes can be due at once, never generate more than max_aircraft
+            if 0 < self._max_aircraft <= self._generated:
+                break
+
+            self.generate_ac(i, self.get_ac_id(self._generated))
+            self._next_ac[i] += self.next_delay()
+            self._generated += 1
+
+    def _spawn_one(self, timer:int):
+        """
+        Generate an aircraft on the only route if its next generation time is the timer
+
+        Parameters
+        ----------
+        timer: int
+            The current time (s)
+        """
+        if self._next_ac[0] == timer:
+            self.generate_ac(0, self.get_ac_id(self._generated))
+            self._next_ac[0] += self.next_delay()
+            self._generated += 1
+
+    def _tick_visual(self):
+        """
+        One step of the simulation held to its deadline for UI operation so it doesn't run too
+        quick, the time taken by the step counts towards its frame
+        """
+        self.step()
+
+        self._deadline += self._frame_dt
+        now = perf_counter()
+        if self._deadline > now:
+            sleep(self._deadline - now)
+        else:
+            self._deadline = now  # Running behind, don't try to catch up
+
 
     def step(self):
         """
         One step of the simulation where one step is the equivilent of 1 second * the time_scale.
         """
 
-        dist_matrix = self.get_distance_matrix()
+        close = self.get_close_pairs()
+
+        # Move every aircraft and follow their routes at once
+        near, on_route = self.advance_fleet()
+        self.advance_routes(near, on_route)
 
-        # Step and update all the aircraft
-        for i, ac in enumerate(self.objects['aircraft'].keys()):
-            self.objects['aircraft'][ac].step(self.area)
+        # Add a path point for the aircraft that are due one, the rest are not touched
+        for i in np.flatnonzero(self.until_sample == 0):
+            ac = self._rows[i]
+            ac.add_path_point()
+            self.until_sample[i] = ac.point_constant
+        self.until_sample -= 1
         
-        self.check_collisions(dist_matrix)
+        self.check_collisions(close)
         
         self.update_active()
 
+    def advance_fleet(self) -> (np.array, np.array):
+        """
+        Advance every aircraft by one step, terminating those that leave the world, and return which
+        are near their next waypoint and which are on their route. With numba this is a single
+        compiled pass over the state arrays.
+        """
+        if self.use_numba:
+            n = len(self.xs)
+            near = np.empty(n, dtype=np.bool_)
+            on_route = np.empty(n, dtype=np.bool_)
+
+            tick_f(self.xs, self.ys, self._vx, self._vy, self.next_wp_xy, self.next_wp_r2, self.seg,
+                float(self.max_dist)**2, float(self.area[0]), float(self.area[1]), self.term, near, on_route)
+
+            return near, on_route
+
+        self.advance()
+
+        # Terminate any aircraft that have left the world
+        oob = np.logical_or.reduce((self.xs < 0, self.xs > self.area[0], self.ys < 0, self.ys > self.area[1]))
+        np.putmask(self.term, oob & (self.term == 0), 2)
+
+        return self.get_near_next_wp(), self.get_on_route()
+
+    def advance(self, dt:float = 1):
+        """
+        Advance the position of every active aircraft in one vectorised update
+
+        Parameters
+        ----------
+        dt: float
+            The number of steps to advance by
+        """
+        if dt == 1:
+            self.xs += self._vx
+            self.ys += self._vy
+        else:
+            self.xs += self._vx*dt
+            self.ys += self._vy*dt
+    
+    def add_state(self, ac:Aircraft, x:float, y:float, spd:float, hdg:float, alt:float) -> int:
+        """
+        Add a new row to the aircraft state arrays, returning its index. This is the one place an
+        aircraft becomes active, so it is also added to the active aircraft here
+
+        Parameters
+        ----------
+        ac: Aircraft
+            The aircraft the row belongs to
+
+        x: float
+            The x coordinate of the aircraft
+
+        y: float
+            The y coordinate of the aircraft
+
+        spd: float
+            The speed of the aircraft
+
+        hdg: float
+            The heading of the aircraft
+
+        alt: float
+            The altitude of the aircraft
+
+        Raises
+        ------
+        ValueError
+            An active aircraft already has the ID of ac
+        """
+        if ac._id in self.aircraft:
+            raise ValueError(f'An active aircraft already has the ID {ac._id}')
+
+        vx, vy = self.velocity(spd, hdg)
+
+        row = {
+            'xs': x,
+            'ys': y,
+            'hdg': hdg,
+            'spd': spd,
+            'alts': alt,
+            '_vx': vx,
+            '_vy': vy,
+            'next_wp_xy': (np.inf, np.inf),
+            'next_wp_r2': 0,
+            'seg': (0, 0, 0, 0, 0),
+            'route_id': -1,
+            'wp_idx': 0,
+            'until_sample': 0,
+            'term': 0
+        }
+
+        if self._n == self._cap:
+            self.reserve(2*self._cap)
+
+        idx = self._n
+
+        for name in self._columns:
+            self._buf[name][idx] = row[name]
+
+        self._rows.append(ac)
+        self.aircraft[ac._id] = ac
+        self._n += 1
+        self._set_views()
+
+        return idx
+    
+    def reserve(self, cap:int):
+        """
+        Grow the state buffers to hold at least cap rows, keeping the active rows
+
+        Parameters
+        ----------
+        cap: int
+            The number of rows the buffers should hold
+        """
+        if cap <= self._cap:
+            return
+
+        for name, (dtype, shape) in self._columns.items():
+            buf = np.empty((cap,)+shape, dtype=dtype)
+            if self._n > 0:
+                buf[:self._n] = self._buf[name][:self._n]
+            self._buf[name] = buf
+
+        self._cap = cap
+        self._set_views()
+    
+    def _set_views(self):
+        """
+        Point each state column at the active rows of its buffer
+        """
+        for name in self._columns:
+            setattr(self, name, self._buf[name][:self._n])
+    
+    def get_value(self, name:string, idx:int):
+        """
+        Returns the value of a state column in row idx. It is read from the backing buffer rather
+        than the column view, so a row read by the UI thread just before the rows are compacted is
+        still in range (the buffers never shrink). The value is not always that aircraft's: a row
+        past the new end keeps the value from before, but a terminated row refilled from the tail
+        holds the moved aircraft's value, so for one frame a terminated aircraft can be drawn with
+        another's state. Nothing stops this without locking the environment while it is drawn.
+
+        Parameters
+        ----------
+        name: string
+            The name of the column
+        
+        idx: int
+            The row of the aircraft
+        """
+        return self._buf[name][idx]
+
+    def set_heading(self, idx:int, hdg:float):
+        """
+        Change the heading of the aircraft in row idx, updating its cached step velocity and label
+
+        Parameters
+        ----------
+        idx: int
+            The row of the aircraft in the state arrays
+
+        hdg: float
+            The new heading of the aircraft
+        """
+        # A detached aircraft has no row, indexing the arrays with None would write every row
+        if idx is None:
+            raise ValueError('The heading of a terminated aircraft can not be changed')
+
+        self.hdg[idx] = hdg
+        self._vx[idx], self._vy[idx] = self.velocity(self.spd[idx], hdg)
+
+        # The aircraft's rendered heading is now out of date
+        self._rows[idx]._hdg_surf = None
+    
+    def velocity(self, spd:float, hdg:float) -> (float, float):
+        """
+        Returns the distance moved in x and y each step by an aircraft at a speed and heading
+
+        Parameters
+        ----------
+        spd: float
+            The speed of the aircraft
+
+        hdg: float
+            The heading of the aircraft
+        """
+        h = sim_heading(hdg)
+        spd = spd*self._inv_scale
+
+        return spd*cos(h), spd*sin(h)
+    
+    def set_route(self, idx:int, k:int):
+        """
+        Put the aircraft in row idx on the route k, at the start of the route
+
+        Parameters
+        ----------
+        idx: int
+            The row of the aircraft in the state arrays
+
+        k: int
+            The index of the route in the route table
+        """
+        if self.route_id[idx] < 0:
+            self._n_routed += 1
+
+        self.route_id[idx] = k
+        self.wp_idx[idx] = 1
+
+        self._load_legs(np.array([idx]))
+    
+    def _load_legs(self, rows: np.array):
+        """
+        Gather the next waypoint and route segment of the aircraft in rows from the route table
+
+        Parameters
+        ----------
+        rows: np.array
+            The rows of the aircraft in the state arrays
+        """
+        flat = self._rt_offset[self.route_id[rows]] + self.wp_idx[rows]
+
+        self.next_wp_xy[rows] = self._rt_xy[flat]
+        self.next_wp_r2[rows] = self._rt_r2[flat]
+        self.seg[rows] = self._rt_seg[flat]
+    
+    def advance_routes(self, near: np.array, on_route: np.array):
+        """
+        Move every aircraft that has reached its next waypoint on along its route and terminate any
+        that have finished (1) or left their routes (2)
+
+        Parameters
+        ----------
+        near: np.array
+            If each aircraft is close enough to have reached its next waypoint
+
+        on_route: np.array
+            If each aircraft is within max_dist of its route
+        """
+        # Nothing to follow, or (the usual case) every aircraft has a route and no mask is needed
+        if self._n_routed == 0:
+            return
+        has_route = True if self._n_routed == self._n else self.route_id >= 0
+
+        cand = np.flatnonzero(near & has_route)
+
+        if len(cand) > 0:
+            # Only the aircraft near their next waypoint are tested against its bounds
+            box = self._rt_box[self._rt_offset[self.route_id[cand]] + self.wp_idx[cand]]
+            x, y = self.xs[cand], self.ys[cand]
+
+            reached = cand[(box[:,0] < x) & (x < box[:,1]) & (box[:,2] < y) & (y < box[:,3])]
+
+            if len(reached) > 0:
+                self.wp_idx[reached] += 1
+
+                done = self.wp_idx[reached] >= self._rt_len[self.route_id[reached]]
+                self.term[reached[done]] = 1
+                self._load_legs(reached[~done])
+
+                # Keep the aircrafts' route objects in step
+                for i in reached:
+                    self._rows[i].route.set_index(int(self.wp_idx[i]))
+        
+        self.term[has_route & ~on_route & (self.term == 0)] = 2
+    
+    def get_near_next_wp(self) -> np.array:
+        """
+        Returns which aircraft are close enough to have reached their next waypoint, worked out for
+        every aircraft in one pass on squared distances
+        """
+        dx = self.xs - self.next_wp_xy[:,0]
+        dy = self.ys - self.next_wp_xy[:,1]
+
+        return dx*dx + dy*dy <= self.next_wp_r2
+    
+    def get_on_route(self) -> np.array:
+        """
+        Returns which aircraft are within max_dist of their route, worked out for every aircraft in
+        one pass on squared distances
+        """
+        x1, y1, dx, dy, inv_det = self.seg.T
+
+        a = (dy*(self.ys-y1) + dx*(self.xs-x1))*inv_det
+        cx = self.xs-(x1+a*dx)
+        cy = self.ys-(y1+a*dy)
+
+        # Past either end of the segment is never on the route
+        on_segment = (0 <= a) & (a <= 1)
+
+        return on_segment & (cx*cx + cy*cy < self.max_dist*self.max_dist)
     
     def update_active(self):
         """
         Update the list of active aircraft, moving terminated aircraft to the terminated list.
         """
-        aircraft = self.objects['aircraft'].keys()
+        if not self.term.any():
+            return
+
+        dead = np.flatnonzero(self.term)
+
+        self._n_routed -= int(np.count_nonzero(self.route_id[dead] >= 0))
+
+        for i in dead:
+            ac = self._rows[i]
+            ac.detach()
+            del self.aircraft[ac._id]
+            self.terminated[ac._id] = ac
+            self._recent.append(ac)
 
-        new_active = OrderedDict()
+        # The terminated aircraft are kept in the order they ended, so the oldest is the first
+        if self.max_terminated > 0:
+            while len(self.terminated) > self.max_terminated:
+                del self.terminated[next(iter(self.terminated))]
 
-        for ac in aircraft:
-            if self.objects['aircraft'][ac].terminated > 0:
-                self.objects['terminated'][ac] = self.objects['aircraft'][ac]
-            else:
-                new_active[ac] = self.objects['aircraft'][ac]
-        self.objects['aircraft'] = new_active
+        # Fill the terminated rows left below the new end with the active rows past it, moving as
+        # few rows as possible. Rows no longer keep the order the aircraft were added in.
+        n = self._n - len(dead)
+        holes = dead[dead < n]
+        tail = np.arange(n, self._n)
+        movers = tail[self.term[n:] == 0]
 
+        if len(holes) > 0:
+            for name in self._columns:
+                self._buf[name][holes] = self._buf[name][movers]
+
+            for i, j in zip(holes, movers):
+                self._rows[i] = self._rows[j]
+                self._rows[i].idx = int(i)
+
+        del self._rows[n:]
+        self._n = n
+        self._set_views()
+
+
+    def get_ac_id(self, n:int) -> string:
+        """
+        Returns the ID of the nth generated aircraft. The IDs are built and interned in blocks
+        rather than formatted for every generation
+
+        Parameters
+        ----------
+        n: int
+            The number of the aircraft
+        """
+        while n >= len(self._id_pool):
+            start = len(self._id_pool)
+            self._id_pool.extend(sys.intern(f'{self.ac_prefix}{i}') for i in range(start, start+1024))
+
+        return self._id_pool[n]
+
+    def next_delay(self) -> int:
+        """
+        Returns a random delay before the next aircraft generation on a route, the delays are drawn
+        in bulk as drawing them one at a time is slow
+        """
+        if self._delay_i == len(self._delays):
+            self._delays = self._rng.choice(self.delay, 1024).tolist()
+            self._delay_i = 0
+
+        self._delay_i += 1
+
+        return self._delays[self._delay_i-1]
+
+    def next_spawn_stats(self) -> (int, int):
+        """
+        Returns a random speed and altitude for a generated aircraft, drawn in bulk as with the delays
+        """
+        if self._stats_i == len(self._stats):
+            self._stats = self._rng.integers((self.min_spd, self.min_alt), (self.max_spd+1, self.max_alt+1), size=(1024, 2)).tolist()
+            self._stats_i = 0
+
+        self._stats_i += 1
+
+        return self._stats[self._stats_i-1]
+
+    def draw_start_routes(self) -> np.array:
+        """
+        Returns the routes that generate an aircraft as soon as the simulation is run, a random non
+        empty set of distinct routes
+        """
+        n = len(self.routes)
+
+        return self._rng.choice(n, size=self._rng.integers(1, n+1), replace=False)
 
     def generate_ac(self, k, _id):
         """
@@ -267,41 +919,76 @@ class Environment():
         _id: string
             The aircraft ID
         """
-        key = list(self.objects['routes'].keys())[k]
-        pos = self.objects['routes'][key].start
-        spd = np.random.randint(self.min_spd,self.max_spd+1)
-        alt = np.random.randint(self.min_alt,self.max_alt+1)
-        hdg = self.objects['routes'][key].init_heading
+        rte, pos, hdg = self._rt_spawn[k]
+        spd, alt = self.next_spawn_stats()
 
-        ac = Aircraft(_id,pos,spd,alt,hdg, scale=self.scale, route=self.objects['routes'][key].copy())
-        self.objects['aircraft'][_id] = ac
+        ac = Aircraft(_id,self,pos,spd,alt,hdg, scale=self.scale, route=rte.copy())
+        self.set_route(ac.idx, k)
     
 
-    def check_collisions(self, dist_matrix: np.array, min_sep: float = 25):
+    def check_collisions(self, close: (np.array, np.array)):
         """
         Check the aircraft in the environment for any collisions and terminate where applicible 
 
         Parameters
         ----------
-        dist_matrix: np.array
-            The matrix of distances between aircraft
-        
-        min_sep: float
-            The min separation between aircraft in meters
+        close: (np.array, np.array)
+            The rows of each pair of aircraft closer than min_sep (see get_close_pairs)
         """
+        i, j = close
 
-        for i, key in enumerate(self.objects['aircraft']):
-            if self.objects['aircraft'][key].terminated > 0:
-                continue
-            dist_array = dist_matrix[i,:]
+        if len(i) == 0:
+            return
 
-            for j, j_key in enumerate(self.objects['aircraft']):
-                if i == j or self.objects['aircraft'][j_key].terminated > 0:
-                    continue
+        # Only pairs where neither aircraft is already terminated
+        active = self.term == 0
+        hit = active[i] & active[j]
 
-                if dist_array[j] < min_sep:
-                    self.objects['aircraft'][key].terminated = 3
-                    self.objects['aircraft'][j_key].terminated = 3
+        self.term[i[hit]] = 3
+        self.term[j[hit]] = 3
+    
+    def get_close_pairs(self) -> (np.array, np.array):
+        """
+        Returns the rows of each pair of aircraft closer than min_sep. The aircraft are bucketed
+        into a grid of min_sep cells, so each is only measured against those in the cells around it.
+        With numba the grid search is a compiled pass over the position arrays.
+        """
+        # No pair to find, the usual case while the environment is starting or quiet
+        if self._n < 2:
+            return self._no_pairs
+
+        if self.use_numba:
+            pi, pj = close_pairs_f(self.xs, self.ys, float(self.min_sep))
+            return (pi, pj) if len(pi) else self._no_pairs
+
+        sep = self.min_sep
+        sep2 = sep*sep
+        xs, ys = self.xs.tolist(), self.ys.tolist()
+
+        grid = defaultdict(list)
+        for k, (x, y) in enumerate(zip(xs, ys)):
+            grid[(int(x//sep), int(y//sep))].append(k)
+
+        pi, pj = [], []
+        for (cx, cy), rows in grid.items():
+            near = [r for a in (cx-1, cx, cx+1) for b in (cy-1, cy, cy+1) for r in grid.get((a,b), ())]
+
+            for k in rows:
+                x, y = xs[k], ys[k]
+                for r in near:
+                    # Each pair is found from both of its aircraft, keep it once
+                    if r <= k:
+                        continue
+                    dx = xs[r] - x
+                    dy = ys[r] - y
+                    if dx*dx + dy*dy < sep2:
+                        pi.append(k)
+                        pj.append(r)
+
+        if not pi:
+            return self._no_pairs
+
+        return np.array(pi, dtype=np.intp), np.array(pj, dtype=np.intp)
 
 
     def draw_objects(self, WINDOW,  max_paths = 100):
@@ -317,14 +1004,19 @@ class Environment():
             The maximum number of paths to draw
         """
 
+        for rte in self.routes.values():
+            rte.draw(WINDOW)
+
         # Draw fixed old paths
+        self.draw_old_paths(WINDOW, max_paths)
 
-        for key, item in self.objects.items():
-            if key == 'terminated':
-                self.draw_old_paths(WINDOW, max_paths)
-                continue
-            for k, __o in item.items():
-                __o.draw(WINDOW)
+        # The active aircraft are already listed in row order, so there is no dictionary to walk. The
+        # list is copied first as the environment changes it while the UI thread draws
+        for ac in tuple(self._rows):
+            ac.draw(WINDOW)
+
+        for wpt in self.waypoints.values():
+            wpt.draw(WINDOW)
                     
     
     def draw_old_paths(self, WINDOW, max_paths = 100):
@@ -337,43 +1029,113 @@ class Environment():
             The window to draw to
         
         max_paths: int
-            The maximum number of paths to draw
+            The maximum number of paths to draw (no more than self.max_paths are kept)
         """
 
-        to_draw = np.array(list(self.objects['terminated'].items()))
-        if len(to_draw) > max_paths:
-            to_draw = to_draw[-max_paths:]
-        for ac in to_draw:
-            ac[1].draw_path(WINDOW)
+        # Only the most recently terminated are kept for drawing, newest last. The environment adds
+        # to them while the UI thread draws, so the deque is copied (atomically) first
+        for ac in islice(reversed(tuple(self._recent)), max_paths):
+            ac.draw_path(WINDOW)
 
     
     def get_is_finished(self) -> bool:
         """
-        Returns if the simulation is active
+        Returns if the simulation is active, set when run starts and ends
         """
-        if not self.ran:
-            return False
-        
-        if self.ran and not self.running:
-            return True
-        
-        return False
+        return self._finished
     
     def get_distance_matrix(self) -> np.array:
         """
-        Generate a distance matrix of aircraft active in the environment
+        Generate a distance matrix of aircraft active in the environment, in the order of the
+        state array rows. With numba this is one compiled pass over the position arrays, otherwise
+        a numpy broadcast.
         """
+        if self.use_numba:
+            out = np.empty((self._n, self._n))
+            pairwise_dist_f(self.xs, self.ys, out)
+
+            return out
+
+        # The positions are held as float32, the matrix is float64 as from the compiled pass
+        xs = self.xs.astype(np.float64)
+        ys = self.ys.astype(np.float64)
+        dx = xs[:,None] - xs[None,:]
+        dy = ys[:,None] - ys[None,:]
 
-        no_ac = len(self.objects['aircraft'].keys())
-        matrix = np.zeros((no_ac, no_ac))
+        return np.sqrt(dx*dx + dy*dy)
 
-        for p_i, p_val in enumerate(self.objects['aircraft'].items()):
-            for o_i, o_val in enumerate(self.objects['aircraft'].items()):
-                if p_i == o_i:
+    def build_route_table(self):
+        """
+        Flatten the waypoints and legs of every route into the route table arrays, to be called
+        whenever the routes change. The waypoints of route k are the rows from _rt_offset[k].
+        """
+        xy, r2, box, seg, lengths = [], [], [], [], []
+
+        for rte in self.routes.values():
+            for wpt in rte._template.waypoints:
+                xy.append(wpt.get())
+                r2.append(wpt.reach_r2)
+                box.append((wpt.x_min, wpt.x_max, wpt.y_min, wpt.y_max))
+            seg.append(rte._template.segments)
+            lengths.append(len(rte._template.waypoints))
+
+        self._rt_len = np.array(lengths, dtype=np.int32)                                    # Waypoints on each route
+        self._rt_offset = np.concatenate(([0], np.cumsum(self._rt_len)[:-1])).astype(np.int32) # First row of each route
+        self._rt_xy = np.array(xy, dtype=np.float64).reshape(-1,2)                          # Waypoint coordinates
+        self._rt_r2 = np.array(r2, dtype=np.float64)                                        # Waypoint squared reach radius
+        self._rt_box = np.array(box, dtype=np.float64).reshape(-1,4)                        # Waypoint bounds
+        self._rt_seg = np.concatenate(seg) if seg else np.empty((0,5))                      # Segment flown towards each waypoint
+
+        # The route, start position and initial heading an aircraft generated on each route is given
+        self._rt_spawn = [(rte, rte.start, rte.init_heading) for rte in self.routes.values()]
+
+    def build_wp_grid(self):
+        """
+        Bucket the waypoints of every route into the waypoint grid, to be called whenever the routes change
+        """
+        self._wp_grid = {}
+        seen = set()
+
+        for rte in self.routes.values():
+            for wpt in rte.origional_route:
+                if id(wpt) in seen:
                     continue
-                
-                dist = round(get_dist(p_val[1].position, o_val[1].position),3)
+                seen.add(id(wpt))
+
+                cell = (int(wpt.x//self._wp_cell), int(wpt.y//self._wp_cell))
+                self._wp_grid.setdefault(cell, []).append(wpt)
+    
+    def get_near_waypoints(self, pos: Point) -> list:
+        """
+        Returns the waypoints in the grid cell of a position and the 8 cells around it
+
+        Parameters
+        ----------
+        pos: Point
+            The position to find waypoints around
+        """
+        cx, cy = int(pos.x//self._wp_cell), int(pos.y//self._wp_cell)
+        near = []
+
+        for i in range(cx-1, cx+2):
+            for j in range(cy-1, cy+2):
+                near.extend(self._wp_grid.get((i,j), ()))
+        
+        return near
+    
+    def get_nearest_waypoint(self, pos: Point):
+        """
+        Returns the waypoint whose bounds are closest to a position, only waypoints in the
+        neighbouring grid cells are considered so None is returned if none are close
+
+        Parameters
+        ----------
+        pos: Point
+            The position to find the nearest waypoint to
+        """
+        near = self.get_near_waypoints(pos)
 
-                matrix[p_i,o_i] = dist
+        if not near:
+            return None
         
-        return matrix
+        return min(near, key=lambda wpt: wpt.dist_from(pos))
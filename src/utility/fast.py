@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""Fast
+Compiled versions of the geometry kernels used every step of the simulation.
+
+The kernels take raw floats rather than Points so that they can be compiled by numba. When
+numba is not installed they run as plain python functions.
+
+Constants
+---------
+HAS_NUMBA
+    If numba is installed and the kernels are compiled
+"""
+
+from math import floor, sqrt
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand in for numba.njit when numba is not installed, returns the function unchanged
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+__author__ = "Ellis Thompson"
+__credits__ = ["Ellis Thompson"]
+
+__license__ = "GNU GPLv3"
+__maintainer__ = "Ellis Thompson"
+__email__ = "thompson_e@gwu.edu"
+__status__ = "Development"
+
+@njit(cache=True, fastmath=True)
+def get_dist_f(x1: float, y1: float, x2: float, y2: float) -> float:
+    """
+    Get the distance between two points
+
+    Parameters
+    ----------
+    x1, y1: float
+        The coordinates of the first point
+
+    x2, y2: float
+        The coordinates of the second point
+    """
+    dx = x2-x1
+    dy = y2-y1
+
+    return sqrt(dx*dx + dy*dy)
+
+@njit(cache=True, fastmath=True)
+def dist_to_line_f(x1: float, y1: float, x2: float, y2: float, px: float, py: float) -> float:
+    """
+    For a given line, get the distance to the closest point on that line
+
+    Parameters
+    ----------
+    x1, y1: float
+        The first point on that line
+
+    x2, y2: float
+        The second point on that line
+
+    px, py: float
+        The point to measure to
+    """
+    dx = x2-x1
+    dy = y2-y1
+    det = dx*dx + dy*dy
+    a = (dy*(py-y1) + dx*(px-x1))/det
+
+    cx = x1+a*dx
+    cy = y1+a*dy
+
+    if not(min(x1,x2) <= cx <= max(x1,x2)) or not(min(y1,y2) <= cy <= max(y1,y2)):
+        return 9e10 # line extends past the reach so value is not valid
+
+    return sqrt((px-cx)*(px-cx) + (py-cy)*(py-cy))
+
+@njit(cache=True, fastmath=True)
+def seg_dist_sq_f(x1: float, y1: float, dx: float, dy: float, inv_det: float, px: float, py: float) -> float:
+    """
+    For a precomputed line segment, get the squared distance to the closest point on that segment
+
+    Parameters
+    ----------
+    x1, y1: float
+        The first point on the segment
+
+    dx, dy: float
+        The vector from the first point to the second point on the segment
+
+    inv_det: float
+        The inverse of the squared segment length (0 for a zero length segment)
+
+    px, py: float
+        The point to measure to
+    """
+    a = (dy*(py-y1) + dx*(px-x1))*inv_det
+
+    if not(0 <= a <= 1):
+        return 9e10*9e10 # line extends past the reach so value is not valid
+
+    cx = px-(x1+a*dx)
+    cy = py-(y1+a*dy)
+
+    return cx*cx + cy*cy
+
+@njit(cache=True, fastmath=True)
+def tick_f(xs, ys, vx, vy, next_wp_xy, next_wp_r2, seg, max_d2: float, bx: float, by: float, term, near, on_route):
+    """
+    One step of the fleet in a single pass, advancing every aircraft then testing if it has left
+    the world, if it is near its next waypoint and if it is still on its route. The arrays are
+    updated in place. This is serial: for these fleet sizes starting worker threads costs more
+    than it saves, and a parallel kernel launched from the simulation thread can hang the
+    process at exit.
+
+    Parameters
+    ----------
+    xs, ys: np.array
+        The coordinates of each aircraft
+
+    vx, vy: np.array
+        The distance each aircraft moves in x and y each step
+
+    next_wp_xy: np.array
+        The coordinates of each aircraft's next waypoint, shape (N, 2)
+
+    next_wp_r2: np.array
+        The squared reach radius of each aircraft's next waypoint
+
+    seg: np.array
+        The route segment each aircraft is flying (x1, y1, dx, dy, 1/det), shape (N, 5)
+
+    max_d2: float
+        The squared maximum deviation from the route
+
+    bx, by: float
+        The bounds of the world
+
+    term: np.array
+        The termination state of each aircraft, set to 2 for any that leave the world
+
+    near: np.array
+        Output, if each aircraft is close enough to have reached its next waypoint
+
+    on_route: np.array
+        Output, if each aircraft is within the maximum deviation of its route
+    """
+    for i in range(xs.shape[0]):
+        x = xs[i] + vx[i]
+        y = ys[i] + vy[i]
+        xs[i] = x
+        ys[i] = y
+
+        if term[i] == 0 and not (0 <= x <= bx and 0 <= y <= by):
+            term[i] = 2
+
+        dx = x - next_wp_xy[i,0]
+        dy = y - next_wp_xy[i,1]
+        near[i] = dx*dx + dy*dy <= next_wp_r2[i]
+
+        on_route[i] = seg_dist_sq_f(seg[i,0], seg[i,1], seg[i,2], seg[i,3], seg[i,4], x, y) < max_d2
+
+@njit(cache=True, fastmath=True)
+def pairwise_dist_f(xs, ys, out):
+    """
+    Fill a matrix with the distance between every pair of points
+
+    Parameters
+    ----------
+    xs, ys: np.array
+        The coordinates of each point
+
+    out: np.array
+        Output, the distance matrix, shape (N, N)
+    """
+    n = xs.shape[0]
+
+    # Worked in float64, the positions can be held as float32
+    for i in range(n):
+        x = np.float64(xs[i])
+        y = np.float64(ys[i])
+        for j in range(n):
+            dx = x - np.float64(xs[j])
+            dy = y - np.float64(ys[j])
+            out[i,j] = sqrt(dx*dx + dy*dy)
+
+@njit(cache=True)
+def close_pairs_f(xs, ys, sep: float):
+    """
+    Find each pair of points closer than sep. The points are sorted into a grid of sep cells, so
+    each is only measured against those in the cells around it. Returns the indices of the first
+    and second point of each pair, the first always the lower. Not fastmath, so the distance
+    test is exactly that of the python version.
+
+    Parameters
+    ----------
+    xs, ys: np.array
+        The coordinates of each point
+
+    sep: float
+        The separation the pairs are closer than
+    """
+    n = xs.shape[0]
+    sep2 = sep*sep
+
+    # Cell of each point, as a single key with a one cell margin so the neighbours of every
+    # cell have a key too
+    cx = np.empty(n, dtype=np.int64)
+    cy = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        cx[i] = np.int64(floor(np.float64(xs[i])/sep))
+        cy[i] = np.int64(floor(np.float64(ys[i])/sep))
+
+    x0 = cx.min() - 1
+    y0 = cy.min() - 1
+    width = cy.max() - y0 + 2
+
+    keys = (cx - x0)*width + (cy - y0)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+
+    pi = np.empty(16, dtype=np.intp)
+    pj = np.empty(16, dtype=np.intp)
+    m = 0
+
+    for i in range(n):
+        x = np.float64(xs[i])
+        y = np.float64(ys[i])
+
+        # The three cells in each neighbouring column are consecutive keys
+        for a in range(-1, 2):
+            lo = np.searchsorted(sorted_keys, keys[i] + a*width - 1)
+            hi = np.searchsorted(sorted_keys, keys[i] + a*width + 1, side='right')
+
+            for s in range(lo, hi):
+                j = order[s]
+                # Each pair is found from both of its points, keep it once
+                if j <= i:
+                    continue
+                dx = np.float64(xs[j]) - x
+                dy = np.float64(ys[j]) - y
+                if dx*dx + dy*dy < sep2:
+                    if m == pi.shape[0]:
+                        pi = np.concatenate((pi, np.empty(m, dtype=np.intp)))
+                        pj = np.concatenate((pj, np.empty(m, dtype=np.intp)))
+                    pi[m] = i
+                    pj[m] = j
+                    m += 1
+
+    return pi[:m], pj[:m]
@@ -6,12 +6,16 @@ prep_routes: Prepares routes adding them to the route object.
 prep_wpts: Prepares waypoint by adding them to the waypoint object
 """
 
-import json
 import string
 
 from src.geography.route import Route
 from src.geography.waypoint import Waypoint
 
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
 
@@ -30,9 +34,9 @@ def load_json(path: string) -> (dict, dict):
     path: string
         The path to the JSON file
     """
-    f = open(path)
-
-    data = json.load(f)
+    # Read as bytes, orjson parses them directly (json.loads accepts bytes as well)
+    with open(path, 'rb') as f:
+        data = loads(f.read())
 
     waypoints = {}
 
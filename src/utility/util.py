@@ -3,12 +3,14 @@
 A collection of utility functions shared between multiple classes.
 """
 
-from math import atan2, degrees
+from functools import lru_cache
+from math import atan2, degrees, fmod, hypot
 
-import numpy as np
 from shapely.geometry import Point as pte
 from shapely.geometry.polygon import Polygon
+from shapely.prepared import PreparedGeometry, prep
 from src.geography.point import Point
+from src.utility.fast import dist_to_line_f
 
 __author__ = "Ellis Thompson"
 __credits__ = ["Ellis Thompson"]
@@ -18,7 +20,7 @@ __maintainer__ = "Ellis Thompson"
 __email__ = "thompson_e@gwu.edu"
 __status__ = "Development"
 
-def get_dist(p1: Point, p2: Point):
+def get_dist(p1: Point, p2: Point) -> float:
     """
     Get the distance between two points
 
@@ -30,7 +32,25 @@ def get_dist(p1: Point, p2: Point):
     p2: Point
         The point of the first position
     """
-    return np.sqrt((p2.x-p1.x)**2+(p2.y-p1.y)**2)
+    return hypot(p2.x-p1.x, p2.y-p1.y)
+
+def get_sq_dist(p1: Point, p2: Point) -> float:
+    """
+    Get the squared distance between two points, for comparisons where the distance itself is
+    not needed
+
+    Parameters
+    ----------
+    p1: Point
+        The point of the first position
+    
+    p2: Point
+        The point of the first position
+    """
+    dx = p2.x-p1.x
+    dy = p2.y-p1.y
+
+    return dx*dx + dy*dy
 
 def get_heading(p1: Point, p2: Point):
     """
@@ -48,7 +68,8 @@ def get_heading(p1: Point, p2: Point):
     x = p2.x - p1.x
     y = p2.y - p1.y
 
-    return int(((degrees(atan2(x,y))+180)*-1)%360)
+    # -(angle+180) taken mod 360, folded into one positive fmod as 540-angle is never negative
+    return int(fmod(540.0 - degrees(atan2(x,y)), 360.0))
 
 def in_bound(bounds: [(int,int)] , pos: Point) -> bool:
         """
@@ -63,8 +84,21 @@ def in_bound(bounds: [(int,int)] , pos: Point) -> bool:
             The point to check
         """
 
-        poly = Polygon(bounds)
-        return poly.contains(pte(pos.get()))
+        # The points are made tuples too so bounds given as lists of lists can be cached
+        return get_polygon(tuple(map(tuple, bounds))).contains(pte(pos.get()))
+
+@lru_cache(maxsize=32)
+def get_polygon(bounds: ((int,int))) -> PreparedGeometry:
+    """
+    Get the prepared polygon for some bounds, the bounds rarely change so each polygon is only
+    built once
+
+    Parameters
+    ----------
+    bounds: ((int,int))
+        The polygon area as a tuple of points
+    """
+    return prep(Polygon(bounds))
 
 def dist_to_line(p1: Point, p2: Point, p3: Point) -> float:
     """
@@ -85,19 +119,6 @@ def dist_to_line(p1: Point, p2: Point, p3: Point) -> float:
     x2, y2 = p2.get()
     x3, y3 = p3.get()
 
-    dx, dy = x2-x1, y2-y1
-    det = (dx*dx) + (dy*dy)
-    a = (dy*(y3-y1)+dx*(x3-x1))/det
-
-    cx, cy = x1+a*dx,y1+a*dy
-
-    min_x, min_y = min(x1,x2), min(y1,y2)
-    max_x, max_y = max(x1,x2), max(y1,y2)
-
-    if not(min_x <= cx <= max_x) or not(min_y <= cy <= max_y):
-        return 9e10 # line extends past the reach so value is not valid
-
-
-    return get_dist(Point(cx,cy), p3)
+    return dist_to_line_f(float(x1), float(y1), float(x2), float(y2), float(x3), float(y3))
 
 
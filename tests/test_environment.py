@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Tests for the aircraft generation of the Environment run loop.
+"""
+
+import json
+
+import numpy as np
+import pytest
+from src.simulation.environment import Environment
+
+__author__ = "Ellis Thompson"
+__credits__ = ["Ellis Thompson"]
+
+__license__ = "GNU GPLv3"
+__maintainer__ = "Ellis Thompson"
+__email__ = "thompson_e@gwu.edu"
+__status__ = "Development"
+
+
+ROUTES = [('RTE1', 'WPT1', 'WPT2'), ('RTE2', 'WPT2', 'WPT1'), ('RTE3', 'WPT3', 'WPT4'), ('RTE4', 'WPT4', 'WPT3')]
+
+@pytest.fixture
+def env_path(tmp_path):
+    """
+    An environment file with four routes, so several routes can come due in the same second
+    """
+    env = {
+        'waypoints': [
+            {'_id': 'WPT1', 'x': 100, 'y': 300},
+            {'_id': 'WPT2', 'x': 700, 'y': 300},
+            {'_id': 'WPT3', 'x': 100, 'y': 500},
+            {'_id': 'WPT4', 'x': 700, 'y': 500}
+        ],
+        'routes': [{'_id': _id, 'route': [start, end]} for _id, start, end in ROUTES]
+    }
+
+    path = tmp_path / 'env.json'
+    path.write_text(json.dumps(env))
+
+    return str(path)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_run_stops_at_max_aircraft(env_path, seed):
+    env = Environment(area=(800,800), visual=False, env_path=env_path, seed=seed)
+    env.run(max_aircraft=7)
+
+    assert env._generated == 7
+    assert len(env.aircraft) + len(env.terminated) == 7
+    assert env.get_is_finished()
+
+@pytest.mark.parametrize('seed', range(20))
+def test_start_routes_are_distinct(env_path, seed):
+    env = Environment(area=(800,800), visual=False, env_path=env_path, seed=seed)
+
+    for _ in range(50):
+        start = env.draw_start_routes()
+
+        assert 1 <= len(start) <= len(ROUTES)
+        assert len(np.unique(start)) == len(start)
+        assert np.all((0 <= start) & (start < len(ROUTES)))